@@ -1,11 +1,16 @@
 import time
-from io import StringIO
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 import requests
 import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 st.set_page_config(page_title="Weather Dashboard", page_icon="🌤️", layout="wide")
 
@@ -13,6 +18,7 @@ GITHUB_USERNAME = "FrancisTembo"
 GITHUB_REPO = "cuddly-broccoli"
 GITHUB_BRANCH = "main"
 GITHUB_RAW_BASE_URL = f"https://raw.githubusercontent.com/{GITHUB_USERNAME}/{GITHUB_REPO}/{GITHUB_BRANCH}/weather_data"
+DISPLAY_TIMEZONE = "Africa/Johannesburg"
 
 CITY_FILES = {
     "Cape Town": "cape_town_weather.csv",
@@ -20,18 +26,95 @@ CITY_FILES = {
     "Kampala": "kampala_weather.csv",
 }
 
+# Declared up front so every city frame shares the same category codes
+CITY_DTYPE = pd.CategoricalDtype(categories=list(CITY_FILES))
+
+# Schema shared by the CSV and Parquet readers; explicit types skip inference.
+# float32/int8 comfortably hold temperature and humidity at a fraction of the
+# memory of the float64/int64 pandas would infer.
+WEATHER_SCHEMA = pa.schema(
+    [
+        # Arrow tags the display timezone while parsing, and nanoseconds match
+        # the combined column, so neither needs a separate conversion pass
+        ("timestamp", pa.timestamp("ns", tz=DISPLAY_TIMEZONE)),
+        ("temperature", pa.float32()),
+        ("humidity", pa.int8()),
+    ]
+)
+CSV_CONVERT_OPTIONS = pacsv.ConvertOptions(
+    column_types={field.name: field.type for field in WEATHER_SCHEMA},
+    include_columns=WEATHER_SCHEMA.names,
+)
+
+# Shared session so concurrent downloads reuse pooled TLS connections, with
+# transient server errors retried before surfacing as a loading error
+SESSION = requests.Session()
+SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=8,
+        pool_maxsize=8,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.3,
+            status_forcelist=(500, 502, 503, 504),
+            raise_on_status=False,
+        ),
+    ),
+)
+
+# Last parsed DataFrame per file, keyed by filename and stored with its ETag so
+# unchanged files can be revalidated with a conditional GET instead of re-parsed
+_ETAG_CACHE: dict[str, tuple[str, pd.DataFrame]] = {}
+
+# Layouts applied to the hand-built figures; traces are created directly with
+# graph_objects rather than through Plotly Express' DataFrame introspection
+TIME_SERIES_LAYOUT = dict(
+    template="plotly_white",
+    hovermode="x unified",
+    legend_title_text="City",
+    height=450,
+    margin=dict(l=40, r=40, t=80, b=40),
+    title_font_size=20,
+    xaxis_title="Time (SAST)",
+)
+BAR_CHART_LAYOUT = dict(
+    template="plotly_white",
+    barmode="relative",  # One bar per trace, so keep each centred on its city
+    showlegend=False,
+    xaxis_title="City",
+)
+
 
 def load_data_from_github(filename: str):
     """
-    Downloads and parses a single CSV file from the GitHub repository.
+    Downloads and parses a single CSV or Parquet file from the GitHub repository.
+    If the file is unchanged since the last download (HTTP 304), the previously
+    parsed DataFrame is returned without re-parsing.
     Returns a DataFrame and an error message if any.
     """
     url = f"{GITHUB_RAW_BASE_URL}/{filename}"
+    cached = _ETAG_CACHE.get(filename)
+    headers = {"If-None-Match": cached[0]} if cached else {}
     try:
-        response = requests.get(url, timeout=10)
+        response = SESSION.get(url, headers=headers, timeout=10)
+        if cached and response.status_code == 304:
+            return cached[1], None
         response.raise_for_status()
-        csv_content = StringIO(response.text)
-        df = pd.read_csv(csv_content, parse_dates=["timestamp"])
+        if not response.content.strip():
+            return pd.DataFrame(), f"The file `{filename}` is empty."
+        if filename.endswith(".parquet"):
+            table = pq.read_table(
+                pa.BufferReader(response.content), columns=WEATHER_SCHEMA.names
+            ).cast(WEATHER_SCHEMA)
+        else:
+            table = pacsv.read_csv(
+                pa.py_buffer(response.content), convert_options=CSV_CONVERT_OPTIONS
+            )
+        df = table.to_pandas()
+        etag = response.headers.get("ETag")
+        if etag:
+            _ETAG_CACHE[filename] = (etag, df)
         return df, None
     except requests.exceptions.HTTPError as e:
         if e.response.status_code == 404:
@@ -42,8 +125,6 @@ def load_data_from_github(filename: str):
         return pd.DataFrame(), f"HTTP error: {e}"
     except requests.exceptions.RequestException as e:
         return pd.DataFrame(), f"Network error: {e}"
-    except pd.errors.EmptyDataError:
-        return pd.DataFrame(), f"The file `{filename}` is empty."
     except Exception as e:
         return (
             pd.DataFrame(),
@@ -51,23 +132,76 @@ def load_data_from_github(filename: str):
         )
 
 
+def _fetch_one(city: str, filename: str):
+    """
+    Downloads a single city's data, tagging the result with the city name.
+    The Parquet mirror published by the fetcher is tried first since it needs
+    no text parsing; the CSV is used if the mirror is unavailable.
+    """
+    df, error = load_data_from_github(filename.replace(".csv", ".parquet"))
+    if error:
+        df, error = load_data_from_github(filename)
+    return city, df, error
+
+
+def combine_city_frames(frames: dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """
+    Combines per-city frames into one frame sorted by city and timestamp.
+    Columns are preallocated and filled city by city, so no intermediate
+    tagged frames or concatenation copies are created.
+    """
+    lengths = [len(df) for df in frames.values()]
+    total = sum(lengths)
+    timestamps = np.empty(total, dtype="datetime64[ns]")
+    temperatures = np.empty(total, dtype=np.float32)
+    # A blank humidity cell arrives as NaN, which int8 cannot represent
+    has_gaps = any(df["humidity"].isna().any() for df in frames.values())
+    humidities = np.empty(total, dtype=np.float32 if has_gaps else np.int8)
+
+    offset = 0
+    for df, length in zip(frames.values(), lengths):
+        # Rows are appended out of order, so sort each city's block as it is copied
+        order = np.argsort(df["timestamp"].values, kind="stable")
+        block = slice(offset, offset + length)
+        timestamps[block] = df["timestamp"].values[order]
+        temperatures[block] = df["temperature"].values[order]
+        humidities[block] = df["humidity"].values[order]
+        offset += length
+
+    codes = np.repeat([CITY_DTYPE.categories.get_loc(city) for city in frames], lengths)
+    return pd.DataFrame(
+        {
+            # numpy holds the UTC instants; re-attaching the zone is a relabel
+            "timestamp": pd.DatetimeIndex(timestamps)
+            .tz_localize("UTC")
+            .tz_convert(DISPLAY_TIMEZONE),
+            "temperature": temperatures,
+            "humidity": humidities,
+            "city": pd.Categorical.from_codes(codes, dtype=CITY_DTYPE),
+        }
+    )
+
+
 @st.cache_data(ttl=3600)  # Cache data for one hour
 def load_all_weather_data():
     """
     Loads and combines weather data from all city CSV files on GitHub.
+    The per-city downloads are independent, so they are fetched concurrently.
+    Returns the combined frame and its row positions in newest-first order.
     """
     with st.spinner("Fetching latest weather data from GitHub..."):
-        all_data = []
+        frames = {}
         errors = []
 
-        for city, filename in CITY_FILES.items():
-            df, error = load_data_from_github(filename)
+        # executor.map yields results in CITY_FILES order
+        with ThreadPoolExecutor(max_workers=len(CITY_FILES)) as executor:
+            results = list(executor.map(_fetch_one, CITY_FILES, CITY_FILES.values()))
+
+        for city, df, error in results:
             if error:
                 errors.append(f"**{city}:** {error}")
             if not df.empty:
-                df["timestamp"] = df["timestamp"].dt.tz_convert("Africa/Johannesburg")
-                df["city"] = city
-                all_data.append(df)
+                frames[city] = df
 
         if errors:
             st.warning(
@@ -78,15 +212,53 @@ def load_all_weather_data():
                 for error in errors:
                     st.error(error)
 
-        if not all_data:
-            return pd.DataFrame(
+        if not frames:
+            empty_df = pd.DataFrame(
                 columns=["city", "timestamp", "temperature", "humidity"]
             )
+            return empty_df, np.empty(0, dtype=np.intp)
 
-        combined_df = pd.concat(all_data, ignore_index=True)
-        return combined_df.sort_values(["city", "timestamp"])
+        combined_df = combine_city_frames(frames)
+        # Row positions newest first across all cities, sorted once per load
+        newest_first = np.argsort(combined_df["timestamp"].values, kind="stable")[::-1]
+        return combined_df, newest_first
 
 
+def filter_by_date_range(df: pd.DataFrame, start_date, end_date) -> pd.DataFrame:
+    """
+    Selects the rows between start_date and end_date (inclusive, in SAST).
+    Expects the frame to be sorted by city and timestamp, so each city's rows
+    form a sorted block whose bounds can be found by binary search.
+    """
+    lo = pd.Timestamp(start_date, tz=DISPLAY_TIMEZONE).to_datetime64()
+    hi = (
+        pd.Timestamp(end_date, tz=DISPLAY_TIMEZONE) + pd.Timedelta(days=1)
+    ).to_datetime64()
+    timestamps = df["timestamp"].values
+
+    selected = []
+    for positions in df.groupby("city", sort=False, observed=True).indices.values():
+        first, last = positions[0], positions[-1] + 1
+        block = timestamps[first:last]
+        start, stop = np.searchsorted(block, [lo, hi])
+        selected.append(np.arange(first + start, first + stop))
+
+    if not selected:
+        return df
+    return df.iloc[np.concatenate(selected)]
+
+
+def _frame_cache_key(df: pd.DataFrame):
+    """
+    Cheap cache key for a filtered frame: its length and time bounds identify
+    the selection without hashing every value on each rerun.
+    """
+    if df.empty:
+        return 0
+    return len(df), df["timestamp"].min().value, df["timestamp"].max().value
+
+
+@st.cache_data(ttl=300, hash_funcs={pd.DataFrame: _frame_cache_key})
 def create_time_series_chart(df: pd.DataFrame, y_value: str, title: str, y_title: str):
     """Creates an enhanced line chart for a given metric."""
     if df.empty:
@@ -97,27 +269,25 @@ def create_time_series_chart(df: pd.DataFrame, y_value: str, title: str, y_title
             ],
         )
 
-    fig = px.line(
-        df,
-        x="timestamp",
-        y=y_value,
-        color="city",
-        title=title,
-        labels={"timestamp": "Time (SAST)", y_value: y_title},
-        markers=True,
-        template="plotly_white",
-    )
-    fig.update_layout(
-        hovermode="x unified",
-        legend_title_text="City",
-        height=450,
-        margin=dict(l=40, r=40, t=80, b=40),
-        title_font_size=20,
+    fig = go.Figure(
+        data=[
+            # WebGL lines without per-point markers keep rendering cheap for
+            # long ranges; the unified hover still reports every city
+            go.Scattergl(
+                x=city_df["timestamp"],
+                y=city_df[y_value],
+                name=city,
+                mode="lines",
+                hovertemplate="%{y:.1f}",
+            )
+            for city, city_df in df.groupby("city", sort=False, observed=True)
+        ]
     )
-    fig.update_traces(marker=dict(size=4), hovertemplate="%{y:.1f}")
+    fig.update_layout(**TIME_SERIES_LAYOUT, title_text=title, yaxis_title=y_title)
     return fig
 
 
+@st.cache_data(ttl=300, hash_funcs={pd.DataFrame: _frame_cache_key})
 def create_comparison_bar_chart(df: pd.DataFrame, value_col: str, title: str):
     """Creates a bar chart to compare the latest values across cities."""
     if df.empty:
@@ -125,18 +295,22 @@ def create_comparison_bar_chart(df: pd.DataFrame, value_col: str, title: str):
             title=title, annotations=[dict(text="No data available.", showarrow=False)]
         )
 
-    latest_data = df.loc[df.groupby("city")["timestamp"].idxmax()]
-    fig = px.bar(
-        latest_data,
-        x="city",
-        y=value_col,
-        color="city",
-        title=title,
-        labels={"city": "City", value_col: value_col.capitalize()},
-        text_auto=".1f",
-        template="plotly_white",
+    # Rows are sorted by (city, timestamp), so each city's last row is its latest
+    latest_data = df.drop_duplicates("city", keep="last")
+    label = value_col.capitalize()
+    fig = go.Figure(
+        data=[
+            go.Bar(
+                x=[city],
+                y=[value],
+                name=city,
+                texttemplate="%{y:.1f}",
+                hovertemplate=f"City=%{{x}}<br>{label}=%{{y}}<extra></extra>",
+            )
+            for city, value in zip(latest_data["city"], latest_data[value_col])
+        ]
     )
-    fig.update_layout(showlegend=False)
+    fig.update_layout(**BAR_CHART_LAYOUT, title_text=title, yaxis_title=label)
     return fig
 
 
@@ -148,19 +322,26 @@ def display_summary_statistics(df: pd.DataFrame, metric: str):
 
     st.subheader(f"📊 Summary Statistics for {metric.capitalize()}")
     cols = st.columns(3)
-    summary = df.groupby("city")[metric].agg(["mean", "max", "min"]).reset_index()
+    summary = (
+        df.groupby("city", sort=False, observed=True)[metric]
+        .agg(["mean", "max", "min"])
+        .reset_index()
+        .to_dict("records")
+    )
 
-    for index, row in summary.iterrows():
+    for index, row in enumerate(summary):
+        city = row["city"]
         with cols[index % 3]:
-            st.metric(label=f"📍 {row['city']} Average", value=f"{row['mean']:.1f}")
-            st.metric(label=f"📈 {row['city']} Max", value=f"{row['max']:.1f}")
-            st.metric(label=f"📉 {row['city']} Min", value=f"{row['min']:.1f}")
+            st.metric(label=f"📍 {city} Average", value=f"{row['mean']:.1f}")
+            st.metric(label=f"📈 {city} Max", value=f"{row['max']:.1f}")
+            st.metric(label=f"📉 {city} Min", value=f"{row['min']:.1f}")
             st.markdown("---")
 
 
 def clear_all_caches():
-    """Clears all st.cache_data caches."""
+    """Clears all st.cache_data caches and the ETag-revalidated downloads."""
     st.cache_data.clear()
+    _ETAG_CACHE.clear()
     st.success("All caches cleared!")
     time.sleep(1)
 
@@ -182,7 +363,7 @@ def main():
             clear_all_caches()
             st.rerun()
 
-    df = load_all_weather_data()
+    df, newest_first = load_all_weather_data()
 
     st.sidebar.header("⚙️ Filters")
 
@@ -200,10 +381,7 @@ def main():
 
     try:
         start_date, end_date = date_range
-        mask = (df["timestamp"].dt.date >= start_date) & (
-            df["timestamp"].dt.date <= end_date
-        )
-        filtered_df = df[mask]
+        filtered_df = filter_by_date_range(df, start_date, end_date)
     except (ValueError, IndexError):
         st.sidebar.error("Please select a valid date range (start and end date).")
         filtered_df = df  # Use unfiltered data if range is invalid
@@ -254,8 +432,11 @@ def main():
         display_summary_statistics(filtered_df, "humidity")
 
     with st.expander("View Raw Data Table"):
+        # filtered_df keeps df's positional index, so reuse the load-time order
+        selected = np.zeros(len(df), dtype=bool)
+        selected[filtered_df.index] = True
         st.dataframe(
-            filtered_df.sort_values("timestamp", ascending=False),
+            df.iloc[newest_first[selected[newest_first]]],
             use_container_width=True,
             hide_index=True,
         )
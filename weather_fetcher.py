@@ -1,13 +1,28 @@
 import csv
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta, timezone
 from typing import Any
 
 import pandas as pd
 import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 DATA_DIR = "weather_data"
+STATE_FILE = ".state.json"
+COORDS_FILE = ".coords.json"
+# ts holds the timestamp as Unix seconds, which loads without string parsing
+COLUMNS = ["timestamp", "temperature", "humidity", "ts"]
+MAX_WORKERS = 6  # Concurrent historical-hour requests per city
+RETRY_POLICY = Retry(
+    total=3,
+    backoff_factor=0.3,
+    status_forcelist=(500, 502, 503, 504),
+    raise_on_status=False,
+)
 BASE_GEOCODING_URL = "http://api.openweathermap.org/geo/1.0/direct"
 BASE_WEATHER_URL = "https://api.openweathermap.org/data/3.0/onecall/timemachine"
 
@@ -18,6 +33,25 @@ CITIES = {
 }
 
 
+def _read_json(path: str) -> dict[str, Any]:
+    """Read a JSON object from disk, returning an empty dict if unavailable"""
+    if os.path.exists(path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading {path}: {e}")
+    return {}
+
+
+def _write_json_atomic(path: str, data: Any):
+    """Write JSON to a temporary file and move it into place"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
 class WeatherFetcher:
     """
     Class to fetch and store historical weather data for specified cities using OpenWeatherMap API.
@@ -31,9 +65,38 @@ class WeatherFetcher:
         self.base_weather_url = BASE_WEATHER_URL
         self.data_dir = DATA_DIR
 
+        # One pooled session so repeated calls reuse the TCP/TLS connection
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=8, pool_maxsize=8, max_retries=RETRY_POLICY
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.state_path = os.path.join(self.data_dir, STATE_FILE)
+        self.coords_path = os.path.join(self.data_dir, COORDS_FILE)
+        self._state: dict[str, dict[str, Any]] = _read_json(self.state_path)
+        self._coords: dict[str, list[float]] = _read_json(self.coords_path)
+        self._cache: dict[str, pd.DataFrame] = {}
+
+        for city_name in CITIES:
+            try:
+                self.migrate_csv(city_name)
+            except Exception as e:
+                print(f"Error migrating data for {city_name}: {e}")
+            parquet_path = self.get_parquet_path(city_name)
+            if city_name in self._state and os.path.exists(parquet_path):
+                try:
+                    self._cache[city_name] = pd.read_parquet(parquet_path)
+                except Exception as e:
+                    print(f"Error loading cached data for {city_name}: {e}")
+
     def get_city_coordinates(self, city_query: str) -> tuple[float, float]:
         """Get latitude and longitude for a given city query using OpenWeatherMap's Geocoding API.
 
+        Results are cached in the data directory's coordinates file, so each city
+        is only geocoded once. Delete the file to force a fresh lookup.
+
         Parameters
         ----------
         city_query : str
@@ -44,16 +107,23 @@ class WeatherFetcher:
         tuple[float, float]
             Latitude and longitude of the city"""
 
+        if city_query in self._coords:
+            lat, lon = self._coords[city_query]
+            return lat, lon
+
         params = {"q": city_query, "limit": 1, "appid": self.api_key}
 
-        response = requests.get(self.base_geocoding_url, params=params)  # type: ignore
+        response = self.session.get(self.base_geocoding_url, params=params)  # type: ignore
         response.raise_for_status()
 
         data = response.json()
         if not data:
             raise ValueError(f"City not found: {city_query}")
 
-        return data[0]["lat"], data[0]["lon"]
+        lat, lon = data[0]["lat"], data[0]["lon"]
+        self._coords[city_query] = [lat, lon]
+        _write_json_atomic(self.coords_path, self._coords)
+        return lat, lon
 
     def get_historical_weather(
         self, lat: float, lon: float, timestamp: int
@@ -82,7 +152,7 @@ class WeatherFetcher:
             "units": "metric",
         }
 
-        response = requests.get(self.base_weather_url, params=params)
+        response = self.session.get(self.base_weather_url, params=params)
         response.raise_for_status()
 
         return response.json()
@@ -92,30 +162,156 @@ class WeatherFetcher:
         filename = CITIES[city_name]["filename"]
         return os.path.join(self.data_dir, filename)
 
+    def get_parquet_path(self, city_name: str) -> str:
+        """Get the full path to the Parquet mirror of a city's CSV file"""
+        return os.path.splitext(self.get_csv_path(city_name))[0] + ".parquet"
+
+    def migrate_csv(self, city_name: str):
+        """Add the ts column to a city CSV written before it existed"""
+        csv_path = self.get_csv_path(city_name)
+        if not os.path.exists(csv_path):
+            return
+
+        with open(csv_path, newline="") as csvfile:
+            header = next(csv.reader(csvfile), [])
+            blank = not header and not csvfile.read().strip()
+        if "ts" in header:
+            return
+
+        if blank:
+            # Nothing to migrate, so give the empty file a header to append to
+            with open(csv_path, "w", newline="") as csvfile:
+                csv.writer(csvfile, lineterminator="\r\n").writerow(COLUMNS)
+            self._state.pop(city_name, None)
+            self._cache.pop(city_name, None)
+            return
+
+        print(f"Adding ts column to {csv_path}")
+        df = pd.read_csv(csv_path, dtype=str)  # Keep existing values verbatim
+        df["ts"] = (
+            pd.to_datetime(df["timestamp"], utc=True).dt.as_unit("s").astype("int64")
+        )
+        df.to_csv(csv_path, columns=COLUMNS, index=False, lineterminator="\r\n")
+
+        # The rewrite invalidates the stored read offset and cached frame
+        self._state.pop(city_name, None)
+        self._cache.pop(city_name, None)
+
+    def read_csv_rows(self, csv_path: str, offset: int) -> pd.DataFrame:
+        """Parse the rows of a city CSV starting at a byte offset
+
+        An offset of 0 reads the whole file, skipping the header. A non-zero
+        offset must fall at the start of a line. Rows missing ts fall back to
+        parsing the timestamp column.
+        """
+        with open(csv_path, "rb") as csvfile:
+            if offset:
+                csvfile.seek(offset - 1)
+                if csvfile.read(1) != b"\n":
+                    raise ValueError(f"offset {offset} is not at a line boundary")
+            lines = csvfile.read().decode("utf-8").splitlines()
+        if offset == 0:
+            lines = lines[1:]  # Skip the header
+
+        # Pad or trim ragged rows, and let blank or malformed cells become NaN
+        # rather than failing the whole load, as pd.read_csv would
+        width = len(COLUMNS)
+        rows = [(row + [""] * width)[:width] for row in csv.reader(lines) if row]
+        df = pd.DataFrame(rows, columns=COLUMNS)
+        df["timestamp"] = pd.to_datetime(
+            pd.to_numeric(df["ts"], errors="coerce"), unit="s", utc=True
+        ).fillna(
+            # Rows from a CSV that could not be migrated have no ts yet
+            pd.to_datetime(df["timestamp"], utc=True, format="ISO8601", errors="coerce")
+        )
+        unparsed = df["timestamp"].isna()
+        if unparsed.any():
+            print(f"Skipping {unparsed.sum()} rows without a valid time in {csv_path}")
+            df = df[~unparsed].reset_index(drop=True)
+        df["ts"] = df["timestamp"].dt.as_unit("s").astype("int64")
+        df["temperature"] = pd.to_numeric(df["temperature"], errors="coerce")
+        df["humidity"] = pd.to_numeric(df["humidity"], errors="coerce").astype("Int64")
+        return df
+
     def load_existing_data(self, city_name: str) -> pd.DataFrame:
-        """Load existing weather data for a specific city"""
+        """Load existing weather data for a specific city
+
+        The CSV is append-only, so only the bytes written since the last load
+        are parsed. The accumulated frame is mirrored to Parquet and the read
+        offset is persisted, letting later runs skip the already-parsed rows.
+        If the appended bytes do not parse, the whole file is re-read.
+        """
         csv_path = self.get_csv_path(city_name)
 
         if os.path.exists(csv_path):
             try:
-                df = pd.read_csv(csv_path)
-                df["timestamp"] = pd.to_datetime(df["timestamp"])
+                size = os.stat(csv_path).st_size
+                cached = self._cache.get(city_name)
+                offset = self._state.get(city_name, {}).get("offset", 0)
+
+                # Re-read from scratch if there is no cache or the file shrank
+                if cached is None or size < offset:
+                    cached, offset = None, 0
+                if cached is not None and size == offset:
+                    return cached
+
+                tail = None
+                if cached is not None:
+                    try:
+                        tail = self.read_csv_rows(csv_path, offset)
+                    except Exception as e:
+                        # The file was edited rather than appended to
+                        print(f"Re-reading {city_name} data in full: {e}")
+                        cached = None
+                if tail is None:
+                    tail = self.read_csv_rows(csv_path, 0)
+
+                df = (
+                    tail
+                    if cached is None
+                    else pd.concat([cached, tail], ignore_index=True)
+                )
+                self._cache[city_name] = df
+                self._state[city_name] = {
+                    "offset": size,
+                    "last_timestamp": (
+                        None if df.empty else df["timestamp"].max().isoformat()
+                    ),
+                }
+                try:
+                    df.to_parquet(
+                        self.get_parquet_path(city_name),
+                        index=False,
+                        compression="snappy",
+                    )
+                    _write_json_atomic(self.state_path, self._state)
+                except Exception as e:
+                    # The mirror only speeds up later runs; the data is still good
+                    print(f"Error caching data for {city_name}: {e}")
                 return df
             except Exception as e:
                 print(f"Error loading existing data for {city_name}: {e}")
-                return pd.DataFrame(columns=["timestamp", "temperature", "humidity"])
-        return pd.DataFrame(columns=["timestamp", "temperature", "humidity"])
+                return pd.DataFrame(columns=COLUMNS)
+        return pd.DataFrame(columns=COLUMNS)
 
-    def data_exists(self, existing_df: pd.DataFrame, timestamp: int | datetime) -> bool:
-        """Check if data already exists for a specific timestamp"""
-        if existing_df.empty:
-            return False
+    def get_last_timestamp(self, city_name: str) -> pd.Timestamp | None:
+        """Get the most recent stored timestamp for a specific city
 
-        if isinstance(timestamp, int):
-            timestamp = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+        While the CSV is the size recorded in the state file, the persisted
+        value is returned without opening the CSV at all.
+        """
+        state = self._state.get(city_name, {})
+        csv_path = self.get_csv_path(city_name)
 
-        matches = existing_df[existing_df["timestamp"] == timestamp]
-        return len(matches) > 0
+        if (
+            state.get("last_timestamp")
+            and os.path.exists(csv_path)
+            and os.stat(csv_path).st_size == state.get("offset")
+        ):
+            return pd.Timestamp(state["last_timestamp"])
+
+        existing_df = self.load_existing_data(city_name)
+        return None if existing_df.empty else existing_df["timestamp"].max()
 
     def extract_hourly_data(self, weather_data, target_timestamp):
         """Extract relevant hourly data from API response"""
@@ -129,6 +325,14 @@ class WeatherFetcher:
             }
         return None
 
+    def fetch_hour(
+        self, lat: float, lon: float, target_time: datetime
+    ) -> dict[str, Any] | None:
+        """Fetch and extract the weather record for a single hour"""
+        timestamp = int(target_time.timestamp())
+        weather_data = self.get_historical_weather(lat, lon, timestamp)
+        return self.extract_hourly_data(weather_data, timestamp)
+
     def save_to_csv(self, city_name: str, data_records: list[dict[str, Any]]):
         """Save weather data to city-specific CSV file"""
         if not data_records:
@@ -137,37 +341,31 @@ class WeatherFetcher:
         csv_path = self.get_csv_path(city_name)
         file_exists = os.path.isfile(csv_path)
 
+        records_df = pd.DataFrame(data_records, columns=COLUMNS)
+        records_df["ts"] = records_df["timestamp"].map(lambda ts: int(ts.timestamp()))
+        records_df["timestamp"] = records_df["timestamp"].map(lambda ts: ts.isoformat())
+
+        # A single buffered write per batch, keeping the csv module's CRLF endings
         with open(csv_path, "a", newline="") as csvfile:
-            fieldnames = ["timestamp", "temperature", "humidity"]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-            if not file_exists:
-                writer.writeheader()
-
-            for record in data_records:
-                writer.writerow(
-                    {
-                        "timestamp": record["timestamp"].isoformat(),
-                        "temperature": record["temperature"],
-                        "humidity": record["humidity"],
-                    }
-                )
+            records_df.to_csv(
+                csvfile, header=not file_exists, index=False, lineterminator="\r\n"
+            )
+
+        # Refresh the Parquet mirror so it is published alongside the CSV
+        self.load_existing_data(city_name)
 
     def get_missing_hours(self, city_name: str, hours_back: int = 24) -> list[datetime]:
         """Identify missing hours for a specific city"""
         existing_df = self.load_existing_data(city_name)
-        now = datetime.now(timezone.utc)
-        missing_hours = []
+        latest_hour = pd.Timestamp(datetime.now(timezone.utc)).floor("h")
+        latest_hour -= pd.Timedelta(hours=1)  # Start from 1 hour ago
 
-        for i in range(1, hours_back + 1):  # Start from 1 hour ago
-            target_hour = (now - timedelta(hours=i)).replace(
-                minute=0, second=0, microsecond=0
-            )
-
-            if not self.data_exists(existing_df, target_hour):
-                missing_hours.append(target_hour)
+        candidates = pd.date_range(end=latest_hour, periods=hours_back, freq="h")
+        existing = pd.DatetimeIndex(existing_df["timestamp"], tz="UTC")
+        missing = candidates.difference(existing)
 
-        return missing_hours
+        # Most recent first
+        return list(missing[::-1].to_pydatetime())
 
     def fetch_city_data(self, city_name: str, target_times: list[datetime]):
         """Fetch weather data for a specific city and list of timestamps"""
@@ -183,25 +381,28 @@ class WeatherFetcher:
             print(f"Getting coordinates for {city_name}...")
             lat, lon = self.get_city_coordinates(city_info["query"])
 
-            for target_time in target_times:
-                try:
-                    print(
-                        f"Fetching {city_name} data for {target_time.strftime('%Y-%m-%d %H:%M UTC')}"
-                    )
-
-                    weather_data = self.get_historical_weather(
-                        lat, lon, int(target_time.timestamp())
-                    )
-                    record = self.extract_hourly_data(
-                        weather_data, int(target_time.timestamp())
-                    )
-
-                    if record:
-                        new_records.append(record)
-                        print(f"✓ {record['temperature']:.1f}°C, {record['humidity']}%")
-                except Exception as e:
-                    print(f"✗ Error fetching {city_name} at {target_time}: {e}")
-                    continue
+            print(f"Fetching {len(target_times)} hour(s) of {city_name} data...")
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                futures = {
+                    executor.submit(self.fetch_hour, lat, lon, target_time): target_time
+                    for target_time in target_times
+                }
+
+                for future in as_completed(futures):
+                    target_time = futures[future]
+                    try:
+                        record = future.result()
+                        if record:
+                            new_records.append(record)
+                            print(
+                                f"✓ {target_time.strftime('%Y-%m-%d %H:%M UTC')}: "
+                                f"{record['temperature']:.1f}°C, {record['humidity']}%"
+                            )
+                    except Exception as e:
+                        print(f"✗ Error fetching {city_name} at {target_time}: {e}")
+
+            # Responses arrive out of order; keep the CSV chronological per batch
+            new_records.sort(key=lambda record: record["timestamp"])
 
             if new_records:
                 self.save_to_csv(city_name, new_records)
@@ -231,9 +432,8 @@ class WeatherFetcher:
         print(f"Fetching data for {latest_hour.strftime('%Y-%m-%d %H:%M UTC')}\n")
 
         for city_name in CITIES.keys():
-            existing_df = self.load_existing_data(city_name)
-
-            if self.data_exists(existing_df, latest_hour):
+            # Rows are only ever added up to the latest complete hour
+            if self.get_last_timestamp(city_name) == latest_hour:
                 print(f"✓ {city_name}: Data already exists")
                 continue
 